@@ -3,12 +3,9 @@ import aw2mods
 from argparse import ArgumentParser
 
 
-def main(in_rom, out_rom):
+def modify(game):
     # This example shows how to make basic modifications to a unit
-    # First, let's load the ROM.
-
-    game = aw2mods.AdvanceWarsTwo(in_rom)
-
+    #
     # Units are accessible via `game.units`
     # You can use the `display` function to view all the inputs
     # This will show the raw bytes that make up the unit, and which bytes
@@ -70,6 +67,15 @@ def main(in_rom, out_rom):
 
     game.units.tcopter.display()
 
+
+def main(in_rom, out_rom):
+    # First, let's load the ROM.
+    game = aw2mods.AdvanceWarsTwo(in_rom)
+
+    # Then make our changes. Keeping them in a `modify` function means
+    # `python -m aw2mods.watch` can re-apply them every time this file is saved
+    modify(game)
+
     # Finally, let's save the game
     game.export(out_rom)
 
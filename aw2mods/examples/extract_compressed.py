@@ -0,0 +1,58 @@
+import os
+import time
+
+import aw2mods
+from aw2mods.framework import scan_lz77
+
+from argparse import ArgumentParser
+
+
+def main(in_rom, out_dir):
+    # This example shows how to work with compressed data
+    #
+    # A lot of the ROM (text, graphics, maps) is compressed with the GBA BIOS LZ77 format.
+    # The `Compressed` type decompresses this data when it is read, and compresses it again
+    # when it is written.
+    #
+    # Let's start by loading the ROM:
+
+    game = aw2mods.AdvanceWarsTwo(in_rom)
+
+    # `scan_lz77` finds every LZ77 stream in the ROM. It has to decompress each one to check
+    # it is real, so it hands us the decompressed data along with the Compressed object.
+
+    start = time.time()
+    assets = list(scan_lz77(game))
+    print("Found {} compressed assets in {:.2f}s".format(len(assets), time.time() - start))
+
+    # Let's write each one out to its own file, named after its position in the ROM
+
+    os.makedirs(out_dir, exist_ok=True)
+    for asset, data in assets:
+        with open(os.path.join(out_dir, "{:07x}.bin".format(asset.get_position())), 'wb') as f:
+            f.write(data)
+
+    # Compressed data is usually reached through a Pointer, just like any other type:
+    #
+    #   pointer = Pointer(Compressed, position_of_pointer, game)
+    #   data = pointer.dereference().read()
+    #
+    # Writing to it compresses the new data. If it no longer fits where it was, it is moved
+    # into free space in the ROM, and the Pointer is updated to point at the new location:
+    #
+    #   pointer.dereference().write(modified_data)
+    #
+    # Be careful: free space is taken from the 0xFF padding at the end of the ROM. If your ROM
+    # has no padding there, or another hack already put data in it, the write will overwrite
+    # game data. In that case, tell the ROM where it is safe to put things first:
+    #
+    #   game.free_space = FreeSpaceAllocator(game, start=known_free_position)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('input_rom', help='Rom to extract compressed data from')
+    parser.add_argument('output_dir', help='Directory to write the decompressed data to')
+
+    args = parser.parse_args()
+    main(args.input_rom, args.output_dir)
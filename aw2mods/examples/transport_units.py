@@ -3,7 +3,7 @@ import aw2mods
 from argparse import ArgumentParser
 
 
-def main(in_rom, out_rom):
+def modify(game):
     # This example shows how to modify the transport properties of a Unit
     #
     # Units have a `transport_pointer` property, which is pointer to a TransportMatrix struct
@@ -11,11 +11,7 @@ def main(in_rom, out_rom):
     # they can be unloaded.
     # There are currently three TransportMatrix structs in the ROM: one for landers, tcopters, and APCs
     #
-    # Let's start by loading the ROM:
-
-    game = aw2mods.AdvanceWarsTwo(in_rom)
-
-    # Now, let's make it so that APCs can carry two units, instead of 1
+    # Let's start by making it so that APCs can carry two units, instead of 1
     #
     # Two is actually the max capacity. Any more, and the units will disappear.
     #
@@ -70,7 +66,11 @@ def main(in_rom, out_rom):
     # Lastly, let's set the MdTank's transport pointer to point to our new TransportMatrix!
     game.units.mdtank.transport_pointer.write(location)
 
-    # Finally, let's save the game
+
+def main(in_rom, out_rom):
+    # Load the ROM, make our changes, then save the game
+    game = aw2mods.AdvanceWarsTwo(in_rom)
+    modify(game)
     game.export(out_rom)
 
 if __name__ == '__main__':
@@ -1,17 +1,25 @@
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 from colorama import init, Back, Style
+import re
 import struct
+import zlib
 
 class Rom(object):
     def __init__(self, rom_file):
         # type: (str) -> None
         with open(rom_file, 'rb') as f:
             content = f.read()
-            self.bites = list(content)
+            self.bites = bytearray(content)
+
+        self.free_space = FreeSpaceAllocator(self)
+        self.decoded_cache = DecodedCache()
+        # When this is a list, every write appends its (position, length) to it
+        self.journal = None
 
     def read_raw(self, position, length):
         # type: (int, int) -> List[int]
-        return self.bites[position: position+length]
+        return list(self.bites[position: position+length])
 
     def read(self, position, length):
         return bytes(self.bites[position: position+length])
@@ -19,6 +27,8 @@ class Rom(object):
     def write(self, position, value):
         # type: (int, bytes) -> None
         self.bites[position: position + len(value)] = list(value)
+        if self.journal is not None:
+            self.journal.append((position, len(value)))
     
     def export(self, output_path):
         # type: (str) -> None
@@ -62,6 +72,10 @@ class Data(ABC):
         assert len(byte) == 1
         self.get_rom().write(self.get_position(), byte * self.get_size())
 
+    def bind_pointer(self, pointer):
+        """Called with the Pointer this was dereferenced from. Does nothing by default"""
+        pass
+
 
 
 class Type(Data):
@@ -173,7 +187,9 @@ class Pointer(PackedType):
     def dereference(self):
         if self.read() == self.NULL_PTR:
             raise Exception("Null Pointer Exception")
-        return self.type(self.read(), self.get_rom())
+        value = self.type(self.read(), self.get_rom())
+        value.bind_pointer(self)
+        return value
 
     def __str__(self):
         if self.read() == self.NULL_PTR:
@@ -338,3 +354,361 @@ class Struct(Data):
     def __str__(self):
         return "{} (size: {})".format(self.__class__, self.get_size())
 
+
+
+LZ77 = 0x10
+HUFFMAN_4 = 0x24
+HUFFMAN_8 = 0x28
+
+# The BIOS LZ77 window is 4096 bytes and a back-reference copies at most 18 bytes
+LZ77_WINDOW = 0x1000
+LZ77_MIN_MATCH = 3
+LZ77_MAX_MATCH = 18
+# How many earlier occurrences of a prefix the compressor tries before giving up
+LZ77_MAX_CHAIN = 32
+
+
+def decompressed_size(data, offset=0):
+    """The decompressed size stored in a BIOS compression header"""
+    return data[offset + 1] | (data[offset + 2] << 8) | (data[offset + 3] << 16)
+
+
+def lz77_decompress(data, offset=0):
+    """Decompress BIOS LZ77 (type 0x10) data starting at `offset`
+
+    Returns the decompressed bytes and the number of compressed bytes consumed.
+    Raises ValueError if the data is not a valid LZ77 stream.
+    """
+    if data[offset] != LZ77:
+        raise ValueError("No LZ77 header at {}".format(hex(offset)))
+
+    size = decompressed_size(data, offset)
+    out = bytearray()
+    pos = offset + 4
+    try:
+        while len(out) < size:
+            flags = data[pos]
+            pos += 1
+            if flags == 0 and size - len(out) >= 8:
+                # Eight literals in a row, which is very common in graphics data
+                block = data[pos:pos + 8]
+                if len(block) != 8:
+                    raise IndexError()
+                out += block
+                pos += 8
+                continue
+
+            for bit in (0x80, 0x40, 0x20, 0x10, 0x08, 0x04, 0x02, 0x01):
+                if flags & bit:
+                    b0 = data[pos]
+                    b1 = data[pos + 1]
+                    pos += 2
+                    length = (b0 >> 4) + LZ77_MIN_MATCH
+                    disp = (((b0 & 0xF) << 8) | b1) + 1
+                    start = len(out) - disp
+                    if start < 0:
+                        raise ValueError("LZ77 back-reference before the start of the data at {}".format(hex(offset)))
+                    if disp >= length:
+                        out += out[start:start + length]
+                    else:
+                        # The copy overlaps itself, so it repeats the last `disp` bytes
+                        pattern = out[start:]
+                        out += (pattern * (length // disp + 1))[:length]
+                else:
+                    out.append(data[pos])
+                    pos += 1
+
+                if len(out) >= size:
+                    break
+    except IndexError:
+        raise ValueError("Truncated LZ77 data at {}".format(hex(offset)))
+
+    del out[size:]
+    return bytes(out), pos - offset
+
+
+def lz77_compress(data, vram_safe=True):
+    """Compress data into a BIOS LZ77 (type 0x10) stream, padded to a multiple of 4 bytes
+
+    With `vram_safe` set, back-references never copy from the previous byte, so the
+    result can also be decompressed by the BIOS LZ77UnCompVram routine.
+    """
+    data = bytes(data)
+    size = len(data)
+    if size >= 1 << 24:
+        raise ValueError("Data is too big to compress")
+
+    out = bytearray([LZ77, size & 0xFF, (size >> 8) & 0xFF, (size >> 16) & 0xFF])
+    min_disp = 2 if vram_safe else 1
+    # Positions where each 3 byte prefix was seen
+    chains = {}
+    pos = 0
+    while pos < size:
+        flag_position = len(out)
+        out.append(0)
+        flags = 0
+        for bit in (0x80, 0x40, 0x20, 0x10, 0x08, 0x04, 0x02, 0x01):
+            if pos >= size:
+                break
+
+            best_length = 0
+            best_disp = 0
+            candidates = chains.get(data[pos:pos + LZ77_MIN_MATCH]) if pos + LZ77_MIN_MATCH <= size else None
+            if candidates:
+                max_length = min(LZ77_MAX_MATCH, size - pos)
+                for candidate in reversed(candidates[-LZ77_MAX_CHAIN:]):
+                    disp = pos - candidate
+                    if disp > LZ77_WINDOW:
+                        break
+                    if disp < min_disp:
+                        continue
+                    length = LZ77_MIN_MATCH
+                    while length < max_length and data[candidate + length] == data[pos + length]:
+                        length += 1
+                    if length > best_length:
+                        best_length = length
+                        best_disp = disp
+                        if length == max_length:
+                            break
+
+            if best_length >= LZ77_MIN_MATCH:
+                flags |= bit
+                disp = best_disp - 1
+                out.append(((best_length - LZ77_MIN_MATCH) << 4) | (disp >> 8))
+                out.append(disp & 0xFF)
+                advance = best_length
+            else:
+                out.append(data[pos])
+                advance = 1
+
+            for p in range(pos, min(pos + advance, size - LZ77_MIN_MATCH + 1)):
+                chains.setdefault(data[p:p + LZ77_MIN_MATCH], []).append(p)
+            pos += advance
+
+        out[flag_position] = flags
+
+    out += bytes(-len(out) % 4)
+    return bytes(out)
+
+
+def huffman_decompress(data, offset=0):
+    """Decompress BIOS Huffman (type 0x24 or 0x28) data starting at `offset`
+
+    Returns the decompressed bytes and the number of compressed bytes consumed.
+    Raises ValueError if the data is not a valid Huffman stream.
+    """
+    if data[offset] not in (HUFFMAN_4, HUFFMAN_8):
+        raise ValueError("No Huffman header at {}".format(hex(offset)))
+
+    bits = data[offset] & 0xF
+    size = decompressed_size(data, offset)
+    tree_size = (data[offset + 4] + 1) * 2
+    root = offset + 5
+    tree_end = offset + 4 + tree_size
+    pos = tree_end
+    out = bytearray()
+    node = root
+    pending = None # The low nibble of a byte, when decoding 4 bit data
+    try:
+        while len(out) < size:
+            word = data[pos] | (data[pos + 1] << 8) | (data[pos + 2] << 16) | (data[pos + 3] << 24)
+            pos += 4
+            for shift in range(31, -1, -1):
+                direction = (word >> shift) & 1
+                value = data[node]
+                # Both children sit next to each other, just after the pair holding the current node
+                child = ((node - offset) & ~1) + offset + ((value & 0x3F) + 1) * 2 + direction
+                if child >= tree_end:
+                    raise ValueError("Huffman tree node out of bounds at {}".format(hex(offset)))
+                if not value & (0x80 >> direction):
+                    node = child
+                    continue
+
+                node = root
+                if bits == 8:
+                    out.append(data[child])
+                elif pending is None:
+                    pending = data[child] & 0xF
+                    continue
+                else:
+                    out.append(pending | ((data[child] & 0xF) << 4))
+                    pending = None
+
+                if len(out) >= size:
+                    break
+    except IndexError:
+        raise ValueError("Truncated Huffman data at {}".format(hex(offset)))
+
+    return bytes(out), pos - offset
+
+
+DECOMPRESSORS = {
+    LZ77: lz77_decompress,
+    HUFFMAN_4: huffman_decompress,
+    HUFFMAN_8: huffman_decompress,
+}
+
+
+def decompress(data, offset=0):
+    """Decompress BIOS compressed data of any supported type starting at `offset`"""
+    decompressor = DECOMPRESSORS.get(data[offset])
+    if decompressor is None:
+        raise ValueError("Unsupported compression type {} at {}".format(hex(data[offset]), hex(offset)))
+    return decompressor(data, offset)
+
+
+class DecodedCache(object):
+    """An LRU cache of decompressed data, keyed by ROM offset
+
+    Each entry remembers a checksum of the compressed bytes it was decoded from, so
+    an entry is dropped as soon as anything overwrites the compressed data.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, data, offset):
+        """Returns the decompressed bytes and compressed size, or None"""
+        entry = self._entries.get(offset)
+        if entry is None:
+            return None
+
+        size, checksum, decoded = entry
+        if zlib.crc32(data[offset:offset + size]) != checksum:
+            del self._entries[offset]
+            return None
+
+        self._entries.move_to_end(offset)
+        return decoded, size
+
+    def put(self, data, offset, size, decoded):
+        self._entries[offset] = (size, zlib.crc32(data[offset:offset + size]), decoded)
+        self._entries.move_to_end(offset)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class FreeSpaceAllocator(object):
+    """Hands out unused regions of the ROM, for data that no longer fits where it was
+
+    Unused space is assumed to be a run of `free_byte`, which is how GBA ROMs are padded.
+    Runs of `free_byte` also show up inside palettes and tables, so unless `start` is given
+    only the padding at the end of the ROM is used.
+    """
+
+    def __init__(self, rom, free_byte=0xFF, start=None):
+        self.rom = rom
+        self.free_byte = free_byte
+        self.cursor = start
+
+    def padding_start(self):
+        # type: () -> int
+        """The position of the run of `free_byte` at the end of the ROM"""
+        return len(self.rom.bites.rstrip(bytes([self.free_byte])))
+
+    def allocate(self, size, alignment=4):
+        # type: (int, int) -> int
+        if self.cursor is None:
+            self.cursor = self.padding_start()
+
+        # Leave one free byte before the allocation, in case the run is the tail of real data
+        needle = bytes([self.free_byte]) * (size + alignment)
+        position = self.rom.bites.find(needle, self.cursor)
+        if position == -1:
+            raise RuntimeError("No free space left for {} bytes".format(size))
+
+        position += 1
+        position += -position % alignment
+        self.cursor = position + size
+        return position
+
+
+class Compressed(Type):
+    """Compressed is BIOS compressed data (LZ77 or Huffman) that is read and written decompressed
+
+    Usually reached through a Pointer. Writing re-compresses the data with LZ77; if the
+    result does not fit in the original space it is moved to free space and the Pointer updated.
+    Free space comes from `rom.free_space`, which only uses the padding at the end of the ROM.
+    If your ROM has no such padding (or it is used by another hack), give the Rom a
+    FreeSpaceAllocator with a `start` you know is unused, or the write will overwrite game data.
+    """
+
+    def __init__(self, position, parent, endian="<", comment=""):
+        super().__init__(position, parent, endian=endian, comment=comment)
+        self.pointer = None
+
+    def bind_pointer(self, pointer):
+        # Compressed data may be relocated when written, so it needs to know who points at it
+        self.pointer = pointer
+
+    def compression_type(self):
+        return self.get_rom().bites[self.get_position()]
+
+    def _decode(self):
+        rom = self.get_rom()
+        position = self.get_position()
+        cached = rom.decoded_cache.get(rom.bites, position)
+        if cached is not None:
+            return cached
+
+        decoded, size = decompress(rom.bites, position)
+        rom.decoded_cache.put(rom.bites, position, size, decoded)
+        return decoded, size
+
+    def get_size(self):
+        """The size of the compressed data in the ROM"""
+        return self._decode()[1]
+
+    def read(self):
+        return self._decode()[0]
+
+    def write(self, value):
+        if self.compression_type() != LZ77:
+            raise NotImplementedError("Only LZ77 data can be written")
+
+        value = bytes(value)
+        encoded = lz77_compress(value)
+        rom = self.get_rom()
+        available = self.get_size()
+        available += -available % 4 # Compressed data is padded to 4 bytes
+
+        if len(encoded) > available:
+            if self.pointer is None:
+                raise Exception("Compressed data grew and has no Pointer to relocate it with")
+            self._position = rom.free_space.allocate(len(encoded))
+            self._parent = rom
+            self.pointer.write(self._position)
+
+        position = self.get_position()
+        rom.write(position, encoded)
+        # Cache the size without the padding, the same as reading it back would
+        rom.decoded_cache.put(rom.bites, position, lz77_decompress(encoded)[1], value)
+
+    def __str__(self):
+        return "Compressed ({}) {} -> {} bytes".format(hex(self.compression_type()), self.get_size(), len(self.read()))
+
+
+def scan_lz77(rom, min_size=0x20, max_size=0x40000):
+    """Find every LZ77 stream in the ROM. Yields (Compressed, decompressed bytes) pairs
+
+    Streams are only looked for at 4 byte aligned positions, which the BIOS requires.
+    """
+    bites = rom.bites
+    # Header byte, 24 bit size, then a flag byte whose first block must be a literal.
+    # The lookahead keeps a match at an unaligned position from hiding the next aligned one
+    header = re.compile(b"(?=\\x10[\\x00-\\xff]{3}[\\x00-\\x7f])")
+    for match in header.finditer(bites):
+        position = match.start()
+        if position % 4:
+            continue
+        if not min_size <= decompressed_size(bites, position) <= max_size:
+            continue
+        try:
+            decoded, size = lz77_decompress(bites, position)
+        except ValueError:
+            continue
+        yield Compressed(position, rom), decoded
@@ -0,0 +1,184 @@
+"""Watch mode: re-apply a mod script every time it is saved
+
+The base ROM and its structs are loaded once and kept in memory. Each time the script
+changes, its `modify(game)` function is run again, and only the bytes that differ from
+the previous run are patched into the existing output ROM.
+
+    python -m aw2mods.watch aw2mods/examples/basic_unit_modifications.py advancewars2.gba modified_advancewars2.gba
+"""
+import os
+import runpy
+import time
+import traceback
+
+import aw2mods
+from aw2mods.framework import FreeSpaceAllocator
+
+from argparse import ArgumentParser
+
+GAMES = {
+    'AdvanceWarsTwo': aw2mods.AdvanceWarsTwo,
+    'AdvanceWarsTwoExtended': aw2mods.AdvanceWarsTwoExtended,
+}
+
+
+def merge_ranges(ranges):
+    """Merge (position, length) pairs into sorted, non-overlapping (start, end) pairs"""
+    merged = []
+    for start, length in sorted(ranges):
+        end = start + length
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(r) for r in merged]
+
+
+class Watcher(object):
+    """Re-runs a mod script against a resident ROM, patching the output ROM in place
+
+    Only writes that go through the framework (`Rom.write`, and the types built on it) are
+    tracked. If a script changes `game.bites` directly, that is detected after the run and
+    the whole output ROM is exported instead of patched.
+    """
+
+    def __init__(self, script, game, output_path, interval=0.05):
+        self.script = script
+        self.game = game
+        self.output_path = output_path
+        self.interval = interval
+
+        self.base = bytes(game.bites)
+        # Where relocated data may go, in case the script's author set it up before watching
+        self.free_space = (game.free_space.free_byte, game.free_space.cursor)
+        # What the output file currently contains, so we know which bytes need patching
+        self.output = None
+        # Ranges of the ROM and of the output file that may differ from the base ROM
+        self.rom_ranges = []
+        self.output_ranges = []
+
+    def _restore(self, ranges):
+        """Put ranges of the ROM back to how they were when it was loaded"""
+        for start, end in ranges:
+            self.game.bites[start:end] = self.base[start:end]
+        free_byte, start = self.free_space
+        self.game.free_space = FreeSpaceAllocator(self.game, free_byte, start)
+
+    def _untracked(self, ranges):
+        """Whether the ROM changed anywhere outside of `ranges`"""
+        expected = bytearray(self.base)
+        for start, end in ranges:
+            expected[start:end] = self.game.bites[start:end]
+        return expected != self.game.bites
+
+    def _export(self):
+        self.game.export(self.output_path)
+        self.output = bytearray(self.game.bites)
+        return len(self.output), 1
+
+    def _patch(self, ranges):
+        """Write the parts of `ranges` that changed since the last run into the output file
+
+        Returns the number of bytes and ranges written.
+        """
+        if (self.output is None or len(self.output) != len(self.game.bites)
+                or not os.path.exists(self.output_path)):
+            return self._export()
+
+        changes = []
+        for start, end in ranges:
+            new = self.game.bites[start:end]
+            old = self.output[start:end]
+            if new == old:
+                continue
+            # Trim the unchanged bytes off both ends
+            first = 0
+            while new[first] == old[first]:
+                first += 1
+            last = len(new)
+            while new[last - 1] == old[last - 1]:
+                last -= 1
+            changes.append((start + first, new[first:last]))
+
+        if changes:
+            with open(self.output_path, 'r+b') as f:
+                for position, value in changes:
+                    f.seek(position)
+                    f.write(value)
+                    self.output[position:position + len(value)] = value
+
+        return sum(len(value) for _, value in changes), len(changes)
+
+    def run(self):
+        """Run the script once. Returns False if the script raised an error"""
+        start = time.time()
+        self._restore(self.rom_ranges)
+        self.rom_ranges = []
+
+        journal = self.game.journal = []
+        try:
+            namespace = runpy.run_path(self.script, run_name='__aw2mods_watch__')
+            if 'modify' not in namespace:
+                raise RuntimeError("{} has no modify(game) function".format(self.script))
+            namespace['modify'](self.game)
+        except Exception:
+            traceback.print_exc()
+            # Leave the output alone, it still holds the last good run
+            self._restore(merge_ranges(journal))
+            if self._untracked([]):
+                self._restore([(0, max(len(self.base), len(self.game.bites)))])
+            return False
+        finally:
+            self.game.journal = None
+
+        self.rom_ranges = merge_ranges(journal)
+        if self._untracked(self.rom_ranges):
+            print("Warning: {} changed game.bites directly, exporting the whole ROM. "
+                  "Write through the framework so changes can be patched".format(self.script))
+            size, count = self._export()
+            # Neither the ROM nor the output can be trusted to match the base outside the journal
+            self.rom_ranges = [(0, max(len(self.base), len(self.game.bites)))]
+            self.output = None
+        else:
+            # Anything written by this run or the last one may have changed
+            size, count = self._patch(merge_ranges(
+                [(s, e - s) for s, e in self.output_ranges + self.rom_ranges]
+            ))
+        self.output_ranges = self.rom_ranges
+
+        print("Applied {} in {:.1f}ms, patched {} bytes in {} ranges".format(
+            self.script, (time.time() - start) * 1000, size, count))
+        return True
+
+    def watch(self):
+        """Run the script, then again every time it is modified. Runs until interrupted"""
+        last_modified = None
+        while True:
+            try:
+                modified = os.stat(self.script).st_mtime_ns
+            except OSError:
+                # Some editors save by replacing the file, so it can briefly be missing
+                modified = last_modified
+            if modified != last_modified:
+                last_modified = modified
+                self.run()
+            time.sleep(self.interval)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('script', help='Mod script with a modify(game) function')
+    parser.add_argument('input_rom', help='Original rom to modify')
+    parser.add_argument('output_rom', help='Name of newly created rom')
+    parser.add_argument('--game', choices=sorted(GAMES), default='AdvanceWarsTwo', help='Which ROM the script modifies')
+    parser.add_argument('--interval', type=float, default=0.05, help='Seconds between checks for changes')
+
+    args = parser.parse_args()
+    if args.input_rom == args.output_rom:
+        raise RuntimeError("Input rom and output rom should not be the same file")
+
+    game = GAMES[args.game](args.input_rom)
+    try:
+        Watcher(args.script, game, args.output_rom, args.interval).watch()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,138 @@
+import random
+
+import pytest
+
+from aw2mods.framework import (
+    Compressed,
+    FreeSpaceAllocator,
+    Pointer,
+    Rom,
+    huffman_decompress,
+    lz77_compress,
+    lz77_decompress,
+    scan_lz77,
+)
+
+
+def random_bytes(size, seed=0):
+    return random.Random(seed).randbytes(size)
+
+
+def make_rom(tmp_path, content):
+    path = tmp_path / "test.gba"
+    path.write_bytes(bytes(content))
+    return Rom(str(path))
+
+
+@pytest.mark.parametrize("data", [
+    b"",
+    b"a",
+    b"abcabcabcabcabcabcabcabc",
+    bytes(1000),
+    bytes(range(256)) * 20,
+    random_bytes(3000),
+], ids=["empty", "one_byte", "repeating", "zeros", "counting", "random"])
+@pytest.mark.parametrize("vram_safe", [True, False])
+def test_lz77_round_trip(data, vram_safe):
+    encoded = lz77_compress(data, vram_safe=vram_safe)
+    assert len(encoded) % 4 == 0
+
+    decoded, size = lz77_decompress(encoded)
+    assert decoded == data
+    assert size <= len(encoded)
+
+
+def test_lz77_decompress_rejects_bad_back_reference():
+    # The first block is a back-reference, but there is nothing to copy from yet
+    with pytest.raises(ValueError):
+        lz77_decompress(bytes([0x10, 8, 0, 0, 0x80, 0x00, 0x00]))
+
+
+def test_huffman_decompress():
+    # A tree with one node whose children are both data: 'A' for 0, 'B' for 1
+    tree = bytes([0x01, 0xC0, ord('A'), ord('B')])
+    stream = (0b0110 << 28).to_bytes(4, 'little')
+
+    assert huffman_decompress(bytes([0x28, 4, 0, 0]) + tree + stream) == (b"ABBA", 12)
+
+    # 4 bit data is decoded low nibble first
+    tree = bytes([0x01, 0xC0, 1, 2])
+    assert huffman_decompress(bytes([0x24, 2, 0, 0]) + tree + stream) == (b"\x21\x12", 12)
+
+
+def test_scan_lz77_finds_stream_after_unaligned_header_byte(tmp_path):
+    data = b"hello world " * 10
+    content = bytearray(b"\xff" * 0x100)
+    content[3] = 0x10
+    encoded = lz77_compress(data)
+    content[4:4 + len(encoded)] = encoded
+
+    rom = make_rom(tmp_path, content)
+    assets = list(scan_lz77(rom))
+
+    assert [(asset.get_position(), decoded) for asset, decoded in assets] == [(4, data)]
+
+
+def test_allocator_uses_trailing_padding(tmp_path):
+    content = bytearray(bytes(range(0xFF)) * 0x81)[:0x8000] + b"\xff" * 0x1000
+    # A table that happens to be all 0xFF, which is not free space
+    content[0x400:0x440] = b"\xff" * 0x40
+    # The last byte of real data is 0xFF too
+    content[0x7fff] = 0xFF
+
+    rom = make_rom(tmp_path, content)
+    first = rom.free_space.allocate(40)
+    second = rom.free_space.allocate(40)
+
+    assert first >= 0x8000
+    assert first % 4 == 0
+    assert second >= first + 40
+
+
+def test_allocator_with_start(tmp_path):
+    content = bytearray(bytes(range(0xFF)) * 0x11)[:0x1000]
+    content[0x400:0x440] = b"\xff" * 0x40
+
+    rom = make_rom(tmp_path, content)
+    assert FreeSpaceAllocator(rom, start=0x400).allocate(40) == 0x404
+
+    with pytest.raises(RuntimeError):
+        rom.free_space.allocate(40)
+
+
+def test_compressed_write_relocates(tmp_path):
+    content = bytearray(b"\xff" * 0x2000)
+    content[:0x1000] = (bytes(range(0xFF)) * 0x11)[:0x1000]
+    encoded = lz77_compress(bytes(200))
+    content[0x100:0x100 + len(encoded)] = encoded
+    content[0x10:0x14] = (0x8000100).to_bytes(4, 'little')
+
+    rom = make_rom(tmp_path, content)
+    pointer = Pointer(Compressed, 0x10, rom)
+    assert pointer.dereference().read() == bytes(200)
+
+    # Smaller data stays where it was
+    pointer.dereference().write(bytes(100))
+    assert pointer.read() == 0x100
+
+    # Data that no longer fits moves into the padding at the end of the ROM
+    data = random_bytes(300)
+    pointer.dereference().write(data)
+    assert pointer.read() >= 0x1000
+    assert pointer.dereference().read() == data
+
+
+def test_compressed_size_does_not_depend_on_cache(tmp_path):
+    content = bytearray(b"\xff" * 0x2000)
+    content[:0x1000] = (bytes(range(0xFF)) * 0x11)[:0x1000]
+    content[0x10:0x14] = (0x8000100).to_bytes(4, 'little')
+    encoded = lz77_compress(random_bytes(20))
+    content[0x100:0x100 + len(encoded)] = encoded
+
+    rom = make_rom(tmp_path, content)
+    pointer = Pointer(Compressed, 0x10, rom)
+    pointer.dereference().write(random_bytes(20, seed=1))
+    size = pointer.dereference().get_size()
+
+    rom.decoded_cache.clear()
+    assert pointer.dereference().get_size() == size
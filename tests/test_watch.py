@@ -0,0 +1,206 @@
+import pytest
+
+from aw2mods import watch
+from aw2mods.framework import Rom
+from aw2mods.watch import Watcher, merge_ranges
+
+BASE = bytes(range(256)) * 16
+
+
+@pytest.fixture
+def paths(tmp_path):
+    rom_path = tmp_path / "base.gba"
+    rom_path.write_bytes(BASE)
+    return rom_path, tmp_path / "mod.py", tmp_path / "out.gba"
+
+
+def write_script(path, body):
+    path.write_text(
+        "from aw2mods.framework import UInt8, UInt16\n"
+        "\n"
+        "def modify(game):\n"
+        + "".join("    {}\n".format(line) for line in body)
+    )
+
+
+def fresh_export(rom_path, script_path, tmp_path):
+    """What running the script the normal way would produce"""
+    namespace = {}
+    exec(script_path.read_text(), namespace)
+    rom = Rom(str(rom_path))
+    namespace['modify'](rom)
+    path = tmp_path / "fresh.gba"
+    rom.export(str(path))
+    return path.read_bytes()
+
+
+@pytest.mark.parametrize("ranges, expected", [
+    ([], []),
+    ([(10, 4), (0, 2)], [(0, 2), (10, 14)]),
+    ([(0, 4), (2, 4)], [(0, 6)]),
+    ([(0, 4), (1, 1)], [(0, 4)]),
+    ([(0, 4), (4, 4)], [(0, 8)]),
+    ([(3, 0)], [(3, 3)]),
+    ([(0, 4), (4, 0), (6, 0)], [(0, 4), (6, 6)]),
+], ids=["empty", "sorted", "overlapping", "contained", "adjacent", "zero_length", "zero_length_mixed"])
+def test_merge_ranges(ranges, expected):
+    assert merge_ranges(ranges) == expected
+
+
+def test_run_patches_output(paths, tmp_path):
+    rom_path, script_path, out_path = paths
+    watcher = Watcher(str(script_path), Rom(str(rom_path)), str(out_path))
+
+    write_script(script_path, ["UInt8(0x10, game).write(0xAA)", "UInt16(0x20, game).write(0xBBCC)"])
+    assert watcher.run()
+    assert out_path.read_bytes() == fresh_export(rom_path, script_path, tmp_path)
+
+    # Change one value and drop another, which has to go back to the base ROM
+    write_script(script_path, ["UInt8(0x10, game).write(0xAB)"])
+    assert watcher.run()
+    output = out_path.read_bytes()
+    assert output == fresh_export(rom_path, script_path, tmp_path)
+    assert output[0x20:0x22] == BASE[0x20:0x22]
+
+    # Writing the same bytes again leaves nothing to patch
+    assert watcher._patch(watcher.rom_ranges) == (0, 0)
+
+
+def test_run_only_writes_changed_bytes(paths, capsys):
+    rom_path, script_path, out_path = paths
+    watcher = Watcher(str(script_path), Rom(str(rom_path)), str(out_path))
+
+    write_script(script_path, ["game.write(0x10, bytes(8))"])
+    watcher.run()
+    assert "patched {} bytes in 1 ranges".format(len(BASE)) in capsys.readouterr().out
+
+    # Only the one byte that differs from the last run is written
+    write_script(script_path, ["game.write(0x10, bytes(3) + b'\\x01' + bytes(4))"])
+    watcher.run()
+    assert "patched 1 bytes in 1 ranges" in capsys.readouterr().out
+    assert out_path.read_bytes()[0x10:0x18] == bytes(3) + b'\x01' + bytes(4)
+
+
+def test_failed_run_leaves_output_alone(paths, tmp_path, capsys):
+    rom_path, script_path, out_path = paths
+    watcher = Watcher(str(script_path), Rom(str(rom_path)), str(out_path))
+
+    write_script(script_path, ["UInt8(0x10, game).write(0xAA)"])
+    assert watcher.run()
+    output = out_path.read_bytes()
+
+    write_script(script_path, ["UInt8(0x30, game).write(0xCC)", "raise ValueError('oops')"])
+    assert not watcher.run()
+    assert "oops" in capsys.readouterr().err
+    assert out_path.read_bytes() == output
+    # The ROM went back to the base, not to the partial run
+    assert bytes(watcher.game.bites) == BASE
+
+    write_script(script_path, ["UInt8(0x10, game).write(0xAB)"])
+    assert watcher.run()
+    assert out_path.read_bytes() == fresh_export(rom_path, script_path, tmp_path)
+
+
+def test_missing_modify_fails(paths):
+    rom_path, script_path, out_path = paths
+    script_path.write_text("x = 1\n")
+    watcher = Watcher(str(script_path), Rom(str(rom_path)), str(out_path))
+
+    assert not watcher.run()
+    assert not out_path.exists()
+
+
+def test_missing_output_is_exported(paths, tmp_path):
+    rom_path, script_path, out_path = paths
+    watcher = Watcher(str(script_path), Rom(str(rom_path)), str(out_path))
+
+    write_script(script_path, ["UInt8(0x10, game).write(0xAA)"])
+    watcher.run()
+    out_path.unlink()
+
+    write_script(script_path, ["UInt8(0x11, game).write(0xAA)"])
+    assert watcher.run()
+    assert out_path.read_bytes() == fresh_export(rom_path, script_path, tmp_path)
+
+
+def test_size_change_is_exported(paths, tmp_path):
+    rom_path, script_path, out_path = paths
+    watcher = Watcher(str(script_path), Rom(str(rom_path)), str(out_path))
+
+    write_script(script_path, ["UInt8(0x10, game).write(0xAA)"])
+    watcher.run()
+
+    # Writing past the end of the ROM makes it bigger
+    write_script(script_path, ["game.write(len(game.bites), b'\\x01\\x02')"])
+    assert watcher.run()
+    assert out_path.read_bytes() == fresh_export(rom_path, script_path, tmp_path)
+
+    write_script(script_path, ["UInt8(0x10, game).write(0xAB)"])
+    assert watcher.run()
+    assert out_path.read_bytes() == fresh_export(rom_path, script_path, tmp_path)
+
+
+def test_direct_writes_are_exported(paths, tmp_path, capsys):
+    rom_path, script_path, out_path = paths
+    watcher = Watcher(str(script_path), Rom(str(rom_path)), str(out_path))
+
+    write_script(script_path, ["UInt8(0x10, game).write(0xAA)"])
+    watcher.run()
+
+    write_script(script_path, ["UInt8(0x10, game).write(0xAA)", "game.bites[0x40] = 0xEE"])
+    assert watcher.run()
+    assert "Warning" in capsys.readouterr().out
+    assert out_path.read_bytes() == fresh_export(rom_path, script_path, tmp_path)
+
+    # Once the direct write is gone, it is reverted in the output too
+    write_script(script_path, ["UInt8(0x10, game).write(0xAA)"])
+    assert watcher.run()
+    assert out_path.read_bytes() == fresh_export(rom_path, script_path, tmp_path)
+
+
+def test_direct_writes_in_failed_run_are_restored(paths):
+    rom_path, script_path, out_path = paths
+    watcher = Watcher(str(script_path), Rom(str(rom_path)), str(out_path))
+
+    write_script(script_path, ["game.bites[0x40] = 0xEE", "raise ValueError('oops')"])
+    assert not watcher.run()
+    assert bytes(watcher.game.bites) == BASE
+
+
+class StopWatching(Exception):
+    pass
+
+
+def test_watch_survives_missing_script(paths, monkeypatch):
+    rom_path, script_path, out_path = paths
+    write_script(script_path, ["UInt8(0x10, game).write(0xAA)"])
+    watcher = Watcher(str(script_path), Rom(str(rom_path)), str(out_path))
+
+    runs = []
+    monkeypatch.setattr(watcher, 'run', lambda: runs.append(True))
+
+    # The script is there, then briefly missing while an editor replaces it, then back
+    real_stat = watch.os.stat
+    missing = iter([False, True, False])
+
+    def stat(path, *args, **kwargs):
+        if path == str(script_path) and next(missing):
+            raise FileNotFoundError(path)
+        return real_stat(path, *args, **kwargs)
+
+    polls = []
+
+    def sleep(interval):
+        polls.append(interval)
+        if len(polls) == 3:
+            raise StopWatching()
+
+    monkeypatch.setattr(watch.os, 'stat', stat)
+    monkeypatch.setattr(watch.time, 'sleep', sleep)
+
+    with pytest.raises(StopWatching):
+        watcher.watch()
+
+    # Ran once at the start, and not again for the missing file or the unchanged one
+    assert runs == [True]
+    assert len(polls) == 3